@@ -1,14 +1,23 @@
 import datetime
 import logging
 
-from podcastpy.player.alarm_scheduler import AlarmScheduler, LocalTimezone
+from pyramid.settings import asbool
+
+from podcastpy.player.alarm_journal import AlarmJournal
+from podcastpy.player.alarm_scheduler import AlarmScheduler, CatchUpPolicy, LocalTimezone
 from podcastpy.player.alarm_store import AlarmStore
 from podcastpy.player.episode_manager import EpisodeManager
 from podcastpy.player.player import Player, PlayerState
+from podcastpy.player.transcoder import Transcoder
 
 
-def get_default_alarm_controller(db):
-    return AlarmController(AlarmScheduler(), EpisodeManager(), Player(), db)
+def get_default_alarm_controller(db, settings):
+    transcoder = Transcoder() if asbool(settings.get('transcode', False)) else None
+    scheduler = AlarmScheduler(
+        journal=AlarmJournal(settings.get('alarm_journal', 'alarms.journal')),
+        catch_up=CatchUpPolicy[settings.get('alarm_catch_up', 'FireOnce')],
+        catch_up_window=datetime.timedelta(minutes=int(settings.get('alarm_catch_up_minutes', 30))))
+    return AlarmController(scheduler, EpisodeManager(settings['db'], transcoder), Player(), db)
 
 
 class AlarmController(object):
@@ -24,12 +33,15 @@ class AlarmController(object):
         default_time = datetime.datetime.combine(datetime.datetime.today(), alarm)
 
         self._alarm_enabled = enabled
-        self._alarm_vid = self._scheduler.add_alarm(default_time.time(), self.play_episode)
-        self._preload_vid = self._scheduler.add_alarm((default_time - datetime.timedelta(seconds=60)).time(), self.download_episode)
+        self._alarm_vid = self._scheduler.add_alarm(default_time.time(), self.play_episode, 'alarm')
+        self._preload_vid = self._scheduler.add_alarm((default_time - datetime.timedelta(seconds=60)).time(), self.download_episode, 'preload')
         self._log.info("Initial alarm id: {}".format(self._alarm_vid))
         self._log.info("Initial preload id: {}".format(self._preload_vid))
 
         self._manager.preload_episode()
+        # Only now that the latest episode is downloaded can a missed alarm play it. The preload above already
+        # covers a missed preload.
+        self._scheduler.run_missed_alarms(already_run=[self._preload_vid])
 
     def change_alarm_time(self, new_time: datetime.datetime, enabled: bool, db: AlarmStore) -> None:
         if self._alarm_vid is None or self._preload_vid is None:
@@ -43,8 +55,8 @@ class AlarmController(object):
 
         self._alarm_enabled = enabled
         db.replace_alarm(new_time.time(), enabled)
-        self._preload_vid = self._scheduler.add_alarm((new_time - datetime.timedelta(seconds=60)).time(), self.download_episode)
-        self._alarm_vid = self._scheduler.add_alarm(new_time.time(), self.play_episode)
+        self._preload_vid = self._scheduler.add_alarm((new_time - datetime.timedelta(seconds=60)).time(), self.download_episode, 'preload')
+        self._alarm_vid = self._scheduler.add_alarm(new_time.time(), self.play_episode, 'alarm')
 
     def get_next_alarm_time(self) -> (datetime.datetime, bool):
         return self._scheduler.get_alarm_time(self._alarm_vid), self._alarm_enabled
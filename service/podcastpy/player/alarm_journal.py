@@ -0,0 +1,133 @@
+import datetime
+import json
+import logging
+import os
+import threading
+
+
+class AlarmJournal(object):
+    """
+    Append-only journal of when each named alarm last fired and when it is next due, so a restarted scheduler
+    neither replays an alarm that already went off nor forgets one that came due while it was down.
+    Write failures are logged rather than raised: the alarms keep running from the in-memory state, and the next
+    write rewrites the whole journal from it.
+    """
+    def __init__(self, path, compact_threshold=64):
+        self._path = path
+        self._compact_threshold = compact_threshold
+        self._log = logging.getLogger(__name__)
+
+        self._fired = {}  # alarm name -> date it last fired
+        self._pending = {}  # alarm name -> datetime it is next due
+
+        # Timer threads and request threads both write to the journal
+        self._lock = threading.Lock()
+        self._fh = None
+        self._records = 0
+        self._dirty = False  # The file is missing records held in memory
+        self._load()
+        # Rewriting on startup drops any record torn by a kill mid-write and keeps the replay O(alarms)
+        self.compact()
+
+    def _load(self):
+        if not os.path.exists(self._path):
+            return
+
+        with open(self._path) as fh:
+            for line in fh:
+                try:
+                    self._apply(json.loads(line))
+                except (ValueError, KeyError, TypeError):
+                    self._log.warning("Ignoring corrupt alarm journal record: {!r}".format(line))
+
+    def _apply(self, record):
+        name = record['name']
+        if record['event'] == 'fired':
+            self._fired[name] = datetime.date.fromisoformat(record['date'])
+        elif record['event'] == 'pending':
+            self._pending[name] = datetime.datetime.fromisoformat(record['at'])
+        elif record['event'] == 'cancelled':
+            self._fired.pop(name, None)
+            self._pending.pop(name, None)
+
+    def _append(self, record):
+        with self._lock:
+            self._apply(record)
+            try:
+                if self._dirty:
+                    # The snapshot already includes this record
+                    self._compact()
+                    return
+
+                self._fh.write(json.dumps(record) + '\n')
+                self._fh.flush()
+                os.fsync(self._fh.fileno())
+
+                self._records += 1
+                if self._records > max(self._compact_threshold, 2 * len(self._pending)):
+                    self._compact()
+            except (OSError, ValueError) as e:
+                self._dirty = True
+                self._log.error("Could not write alarm journal {}: {}".format(self._path, e))
+
+    def _snapshot(self):
+        records = [{'event': 'fired', 'name': name, 'date': date.isoformat()} for name, date in self._fired.items()]
+        records += [{'event': 'pending', 'name': name, 'at': at.isoformat()} for name, at in self._pending.items()]
+        return records
+
+    def compact(self):
+        """
+        Rewrites the journal to one fired and one pending record per alarm
+        """
+        with self._lock:
+            try:
+                self._compact()
+            except (OSError, ValueError) as e:
+                self._dirty = True
+                self._log.error("Could not compact alarm journal {}: {}".format(self._path, e))
+
+    def _compact(self):
+        records = self._snapshot()
+        tmp_path = self._path + '.tmp'
+        with open(tmp_path, 'w') as fh:
+            for record in records:
+                fh.write(json.dumps(record) + '\n')
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_path, self._path)
+        # Without this the rename may not survive a power cut, losing everything appended to the new file
+        dir_fd = os.open(os.path.dirname(os.path.abspath(self._path)), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+        # The old handle is only swapped out once the new file is in place, so a failure above leaves it usable
+        fh = open(self._path, 'a')
+        if self._fh is not None:
+            self._fh.close()
+        self._fh = fh
+        self._records = len(records)
+        self._dirty = False
+
+    def get_last_fired(self, name):
+        with self._lock:
+            return self._fired.get(name)
+
+    def get_pending(self, name):
+        with self._lock:
+            return self._pending.get(name)
+
+    def record_fired(self, name, date: datetime.date):
+        self._append({'event': 'fired', 'name': name, 'date': date.isoformat()})
+
+    def record_pending(self, name, at: datetime.datetime):
+        self._append({'event': 'pending', 'name': name, 'at': at.isoformat()})
+
+    def record_cancelled(self, name):
+        self._append({'event': 'cancelled', 'name': name})
+
+    def close(self):
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
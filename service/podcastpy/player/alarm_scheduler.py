@@ -4,6 +4,7 @@ import threading
 import time as _time
 import sortedcontainers
 import logging
+from enum import Enum
 
 # From https://docs.python.org/3.5/library/datetime.html#datetime.tzinfo
 ZERO = datetime.timedelta(0)
@@ -48,32 +49,58 @@ class LocalTimezone(datetime.tzinfo):
         return tt.tm_isdst > 0
 
 
+class CatchUpPolicy(Enum):
+    Skip = 1  # Alarms that came due while the service was down are dropped
+    FireOnce = 2  # The most recent missed occurrence is run as soon as the alarm is re-added
+
+
+def _local_now():
+    return datetime.datetime.now(LocalTimezone())
+
+
 class AlarmScheduler(object):
     """
     Provides an interface for scheduling daily alarms which run a given function.
+    Named alarms are recorded in the optional journal so their state survives a restart.
     """
-    def __init__(self):
+    def __init__(self, journal=None, catch_up=CatchUpPolicy.Skip, catch_up_window=datetime.timedelta(minutes=30),
+                 clock=_local_now, timer_factory=threading.Timer):
         self._timer_thread = None
+        self._journal = journal
+        self._catch_up = catch_up
+        self._catch_up_window = catch_up_window
+        self._clock = clock
+        self._timer_factory = timer_factory
+
+        # Timer threads and request threads both change the alarms and the armed timer
+        self._lock = threading.RLock()
+
+        self._missed = []  # (missed datetime, alarm vId) found by add_alarm, run by run_missed_alarms
 
         # Need to be able to quickly index on time
         self._alarm_time_index = sortedcontainers.SortedDict()  # time -> alarm vId
 
         # Need to be able to quickly index on some id
-        self._alarm_lookup = {}  # alarm vId -> (callback, alarm_time, last_trigger_date)
+        self._alarm_lookup = {}  # alarm vId -> (callback, alarm_time, last_trigger_date, name)
 
         self._next_vid = None
         self._log = logging.getLogger(__name__)
         self._log.info("Alarm scheduler created")
 
     def _reschedule(self):
+        with self._lock:
+            self._reschedule_locked()
+
+    def _reschedule_locked(self):
         if self._timer_thread is not None:
             self._log.info("Cancelling timer thread")
             self._timer_thread.cancel()
+            self._timer_thread = None
 
-        if len(self._alarm_lookup) is 0:
+        if len(self._alarm_lookup) == 0:
             return
 
-        now = datetime.datetime.now(LocalTimezone())
+        now = self._clock()
         next_time, self._next_vid = self.get_next_alarm(now.time(), now.date())
 
         for_tomorrow = now.date() == self._alarm_lookup[self._next_vid][2]
@@ -81,7 +108,7 @@ class AlarmScheduler(object):
         next_alarm_time = AlarmScheduler.get_next_alarm_datetime(next_time, now, for_tomorrow)
         self._log.info("Next alarm: {}".format(next_alarm_time))
         s = (next_alarm_time - now).total_seconds()
-        self._timer_thread = threading.Timer(
+        self._timer_thread = self._timer_factory(
             s, self._run_alarm, [self._alarm_lookup[self._next_vid][0], self._next_vid, next_alarm_time.date()])
 
         self._timer_thread.start()
@@ -90,17 +117,64 @@ class AlarmScheduler(object):
         # Pass the date in as we don't want to call datetime.now() here as it might get weird with times just before
         # midnight.
         self._log.info("_run_alarm")
-        self._alarm_lookup[vid] = (self._alarm_lookup[vid][0], self._alarm_lookup[vid][1], trigger_date)
-        callback()
+        if self._mark_fired(vid, trigger_date):
+            callback()
         self._reschedule()
 
-    def add_alarm(self, time, callback_fn):
+    def _mark_fired(self, vid, trigger_date):
+        """
+        :return: False if the alarm no longer exists or already fired on trigger_date, so it must not run
+        """
+        with self._lock:
+            if vid not in self._alarm_lookup:
+                return False
+
+            callback, alarm_time, last_trigger_date, name = self._alarm_lookup[vid]
+            if last_trigger_date == trigger_date:
+                return False
+
+            self._alarm_lookup[vid] = (callback, alarm_time, trigger_date, name)
+            if self._journal is not None and name is not None:
+                # Record before running so a kill during the callback never replays it
+                self._journal.record_fired(name, trigger_date)
+                self._journal.record_pending(name, AlarmScheduler.get_next_alarm_datetime(
+                    alarm_time, datetime.datetime.combine(trigger_date, alarm_time), True))
+            return True
+
+    def run_missed_alarms(self, already_run=()):
+        """
+        Runs the alarms add_alarm found to have been missed while the service was down, oldest first, on the
+        calling thread
+        :param already_run: Ids of alarms whose missed occurrence the caller has already taken care of, these are
+        only recorded as fired
+        """
+        with self._lock:
+            missed = sorted(self._missed, key=lambda m: m[0])
+            self._missed = []
+
+        for missed_at, vid in missed:
+            if vid in already_run:
+                self._mark_fired(vid, missed_at.date())
+                continue
+
+            self._log.info("Catching up alarm {} missed at {}".format(vid, missed_at))
+            with self._lock:
+                callback = self._alarm_lookup[vid][0] if vid in self._alarm_lookup else None
+            if callback is not None:
+                self._run_alarm(callback, vid, missed_at.date())
+
+    def add_alarm(self, time, callback_fn, name=None):
         """
         Adds an alarm to the alarm service
         :param time: The time to run the alarm at (daily)
         :param callback_fn: The function to be run upon the alarm triggering
+        :param name: Stable name used to restore the alarm's state from the journal after a restart
         :return: The id of the alarm added
         """
+        with self._lock:
+            return self._add_alarm_locked(time, callback_fn, name)
+
+    def _add_alarm_locked(self, time, callback_fn, name):
         # Check for a time collision & apply some nudging
         self._log.info("Adding alarm at {}".format(time))
         t = copy.copy(time)
@@ -111,12 +185,31 @@ class AlarmScheduler(object):
         while new_vid in self._alarm_lookup:
             new_vid += 1
 
-        self._alarm_lookup[new_vid] = (callback_fn, t, None)
+        now = self._clock()
+        last_trigger_date = None
+        missed_at = None
+        if self._journal is not None and name is not None:
+            last_trigger_date = self._journal.get_last_fired(name)
+            pending = self._journal.get_pending(name)
+            if pending is not None and pending <= now and pending.date() != last_trigger_date:
+                missed_at = pending
+
+        self._alarm_lookup[new_vid] = (callback_fn, t, last_trigger_date, name)
         self._alarm_time_index[t] = new_vid
 
-        now = datetime.datetime.now()
+        if missed_at is not None and self._catch_up is CatchUpPolicy.FireOnce \
+                and now - missed_at <= self._catch_up_window:
+            # Nothing is journaled until run_missed_alarms runs it, so a kill before then is caught up again
+            self._log.info("Alarm {} missed at {} will be caught up".format(name, missed_at))
+            self._missed.append((missed_at, new_vid))
+        elif self._journal is not None and name is not None:
+            if missed_at is not None:
+                self._log.info("Skipping alarm {} missed at {}".format(name, missed_at))
+            self._journal.record_pending(name, AlarmScheduler.get_next_alarm_datetime(
+                t, now, now.date() == last_trigger_date))
+
         if self.get_next_alarm(now.time(), now.date())[1] == new_vid:
-            self._reschedule()
+            self._reschedule_locked()
 
         return new_vid
 
@@ -127,20 +220,26 @@ class AlarmScheduler(object):
         :return: True if alarm exists and was removed, False if alarm did not exist
         """
         self._log.info("Removing alarm: {}".format(alarm_id))
-        if alarm_id not in self._alarm_lookup:
-            return False
+        with self._lock:
+            if alarm_id not in self._alarm_lookup:
+                return False
+
+            _, time, _, name = self._alarm_lookup.pop(alarm_id)
+            idx = self._alarm_time_index.bisect_left(time)
+            self._alarm_time_index.popitem(idx)
+            self._missed = [m for m in self._missed if m[1] != alarm_id]
 
-        time = self._alarm_lookup.pop(alarm_id)[1]
-        idx = self._alarm_time_index.bisect_left(time)
-        self._alarm_time_index.popitem(idx)
+            if self._journal is not None and name is not None:
+                self._journal.record_cancelled(name)
 
-        if self._next_vid is alarm_id:
-            self._reschedule()
+            if self._next_vid == alarm_id:
+                self._reschedule_locked()
 
-        return True
+            return True
 
     def get_alarm_time(self, vid):
-        return self._alarm_lookup[vid][1]
+        with self._lock:
+            return self._alarm_lookup[vid][1]
 
     def get_next_alarm(self, at_time, now_date):
         """
@@ -156,7 +255,7 @@ class AlarmScheduler(object):
 
         idx = self._alarm_time_index.bisect_right(at_time) % len(self._alarm_time_index)
         start = idx
-        while self._alarm_lookup[self._alarm_time_index.peekitem(idx)[1]][2] is now_date:
+        while self._alarm_lookup[self._alarm_time_index.peekitem(idx)[1]][2] == now_date:
             idx = (idx + 1) % len(self._alarm_time_index)
             if start >= idx:
                 break
@@ -5,6 +5,7 @@ import sqlite3
 from pyramid.events import subscriber, ApplicationCreated, NewRequest
 
 from podcastpy.player.alarm_scheduler import LocalTimezone
+from podcastpy.player.episode_index import EpisodeIndex, create_episode_tables
 
 log = logging.getLogger(__name__)
 
@@ -20,13 +21,16 @@ def create_db(event) -> None:
         enabled integer
     );''')
     db.commit()
-    event.app.registry.notify(DbCreated(AlarmStore(db)))
+    create_episode_tables(db)
+    event.app.registry.notify(DbCreated(AlarmStore(db), event.app.registry.settings))
     db.close()
 
 
 @subscriber(NewRequest)
 def new_request_subscriber(event) -> None:
-    event.request.db = AlarmStore(sqlite3.connect(event.request.registry.settings['db']))
+    db = sqlite3.connect(event.request.registry.settings['db'])
+    event.request.db = AlarmStore(db)
+    event.request.episode_index = EpisodeIndex(db)
     event.request.add_finished_callback(close_db_connection)
 
 
@@ -59,5 +63,6 @@ class AlarmStore(object):
 
 
 class DbCreated(object):
-    def __init__(self, db):
+    def __init__(self, db, settings):
         self.db = db
+        self.settings = settings
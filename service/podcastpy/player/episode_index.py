@@ -0,0 +1,157 @@
+import calendar
+import datetime
+import html
+import logging
+import re
+
+log = logging.getLogger(__name__)
+
+# Keeps the offset well inside SQLite's integer range, nobody pages this far through a podcast catalogue
+MAX_PAGE = 10000
+
+
+def create_episode_tables(db) -> None:
+    """
+    Creates the episode metadata table and the FTS5 index kept in sync with it by triggers.
+    """
+    db.executescript('''
+    create table if not exists episodes (
+        id integer primary key autoincrement,
+        feed_url text not null,
+        guid text not null,
+        title text,
+        description text,
+        published text,
+        duration text,
+        unique (feed_url, guid)
+    );
+    drop index if exists episodes_published;
+    create virtual table if not exists episodes_fts using fts5 (
+        title,
+        description,
+        content='episodes',
+        content_rowid='id'
+    );
+    create trigger if not exists episodes_ai after insert on episodes begin
+        insert into episodes_fts (rowid, title, description) values (new.id, new.title, new.description);
+    end;
+    create trigger if not exists episodes_ad after delete on episodes begin
+        insert into episodes_fts (episodes_fts, rowid, title, description)
+            values ('delete', old.id, old.title, old.description);
+    end;
+    create trigger if not exists episodes_au after update on episodes begin
+        insert into episodes_fts (episodes_fts, rowid, title, description)
+            values ('delete', old.id, old.title, old.description);
+        insert into episodes_fts (rowid, title, description) values (new.id, new.title, new.description);
+    end;
+    ''')
+    db.commit()
+
+
+_TAG_RE = re.compile(r'<[^>]*>')
+_CONTROL_RE = re.compile(r'[\x00-\x1f\x7f]')
+
+
+def _to_fts_query(query: str) -> str:
+    # Quote every term so user input is never interpreted as FTS5 query syntax. FTS5 can't parse control
+    # characters such as NUL even inside quotes, so they are treated as whitespace.
+    query = _CONTROL_RE.sub(' ', query)
+    return ' '.join('"{}"'.format(term.replace('"', '""')) for term in query.split())
+
+
+def _strip_html(text):
+    if text is None:
+        return None
+    return ' '.join(html.unescape(_TAG_RE.sub(' ', text)).split())
+
+
+def _entry_published(entry):
+    parsed = entry.get('published_parsed')
+    if parsed is None:
+        return None
+    return datetime.datetime.fromtimestamp(calendar.timegm(parsed), datetime.timezone.utc).isoformat()
+
+
+def _entry_guid(entry):
+    guid = entry.get('id')
+    if guid:
+        return guid
+    links = entry.get('links') or []
+    if links:
+        return links[0].get('href')
+    return entry.get('title')
+
+
+class EpisodeIndex(object):
+    """
+    Full-text index over the metadata of every episode seen in the followed feeds.
+    """
+    def __init__(self, db):
+        self._db = db
+
+    def update_feed(self, feed_url: str, entries) -> int:
+        """
+        Inserts new episodes of a feed and refreshes the ones whose metadata changed
+        :param feed_url: The url of the feed the entries came from
+        :param entries: The feedparser entries of the feed
+        :return: The number of episodes inserted or updated
+        """
+        rows = []
+        for entry in entries:
+            guid = _entry_guid(entry)
+            if guid is None:
+                continue
+            rows.append((feed_url, guid, entry.get('title'), _strip_html(entry.get('summary')),
+                         _entry_published(entry), entry.get('itunes_duration')))
+
+        # Unchanged episodes are left alone so the FTS index is only touched for new or edited ones
+        c = self._db.executemany('''insert into episodes (feed_url, guid, title, description, published, duration)
+            values (?, ?, ?, ?, ?, ?)
+            on conflict (feed_url, guid) do update set
+                title = excluded.title,
+                description = excluded.description,
+                published = excluded.published,
+                duration = excluded.duration
+            where title is not excluded.title
+                or description is not excluded.description
+                or published is not excluded.published
+                or duration is not excluded.duration;''', rows)
+        self._db.commit()
+
+        log.info("Indexed feed {}: {} entries, {} changed".format(feed_url, len(rows), c.rowcount))
+        return c.rowcount
+
+    def search(self, query: str, page: int = 0, per_page: int = 20) -> (list, bool):
+        """
+        Searches episode titles and descriptions, best matches first
+        :param query: Free text search terms, all of which must match
+        :param page: Zero based page number
+        :param per_page: Number of results per page
+        :return: (list of result dicts, whether there is another page)
+        """
+        if page < 0 or page > MAX_PAGE:
+            raise ValueError("Page must be >= 0 and <= {}".format(MAX_PAGE))
+        if per_page < 1 or per_page > 100:
+            raise ValueError("Results per page must be >= 1 and <= 100")
+
+        fts_query = _to_fts_query(query)
+        if not fts_query:
+            return [], False
+
+        c = self._db.cursor()
+        # Fetch one extra row to know whether there is a next page without counting every match
+        c.execute('''select e.feed_url, e.guid, e.title, e.description, e.published, e.duration
+            from episodes_fts
+            join episodes e on e.id = episodes_fts.rowid
+            where episodes_fts match ?
+            order by bm25(episodes_fts, 10.0, 1.0)
+            limit ? offset ?;''', (fts_query, per_page + 1, page * per_page))
+        rows = c.fetchall()
+
+        results = [{'feed_url': row[0],
+                    'guid': row[1],
+                    'title': row[2],
+                    'description': row[3],
+                    'published': row[4],
+                    'duration': row[5]} for row in rows[:per_page]]
+        return results, len(rows) > per_page
@@ -1,20 +1,97 @@
+import contextlib
+import logging
+import os
+import sqlite3
+import threading
+
 import feedparser
 import requests
 
+from podcastpy.player.episode_index import EpisodeIndex
+
 
 class EpisodeManager(object):
-    def __init__(self):
+    def __init__(self, db_path=None, transcoder=None):
         self._url = "https://rss.art19.com/nu-nl-dit-wordt-het-nieuws"
+        self._db_path = db_path
+        self._transcoder = transcoder
         self.picture_url = ""
 
+        self._episode_path = "episode.mp3"
+        self._compact_path = "episode.compact.mp4"
+
+        # Bumped on every download so a transcode of an older episode is never played
+        self._generation = 0
+        self._compact_ready = False
+        self._lock = threading.Lock()
+        self._log = logging.getLogger(__name__)
+
     def preload_episode(self):
         feed = feedparser.parse(self._url)
         feed_entry = feed.entries[0]
         self.picture_url = feed_entry.image.href
         podcast_url = feed_entry.links[0].href
         r = requests.get(podcast_url)
-        with open("episode.mp3", "wb") as fh:
+
+        with self._lock:
+            self._generation += 1
+            self._compact_ready = False
+            generation = self._generation
+
+        with open(self._episode_path, "wb") as fh:
             fh.write(bytes(r.content))
 
+        self.transcode_episode(generation)
+        self.index_feed(feed)
+
+    def index_feed(self, feed):
+        if self._db_path is None:
+            return
+
+        # Runs on the scheduler's thread, so it can't share the connection used by requests. Search is a side
+        # feature, a failure here must never stop the alarm from being rescheduled.
+        try:
+            with contextlib.closing(sqlite3.connect(self._db_path)) as db:
+                EpisodeIndex(db).update_feed(self._url, feed.entries)
+        except sqlite3.Error as e:
+            self._log.error("Indexing feed {} failed: {}".format(self._url, e))
+
+    def transcode_episode(self, generation):
+        if self._transcoder is None:
+            return
+
+        # Runs on the scheduler's thread, transcoding is optional and must never stop the alarm
+        try:
+            future = self._transcoder.submit(self._episode_path, self._compact_path)
+        except Exception as e:
+            self._log.error("Could not queue transcode, keeping original episode: {}".format(e))
+            return
+
+        future.add_done_callback(lambda f: self._on_transcoded(f, generation))
+
+    def _on_transcoded(self, future, generation):
+        try:
+            result = future.result()
+        except Exception as e:
+            self._log.error("Transcoding failed, keeping original episode: {}".format(e))
+            return
+
+        self._log.info("Transcoded {}: {} -> {} bytes (ratio {:.1f}), {:.1f}s CPU".format(
+            result.source_path, result.source_size, result.compact_size, result.compression_ratio,
+            result.cpu_seconds))
+
+        with self._lock:
+            if generation != self._generation:
+                return
+
+            self._compact_ready = True
+            # Only the compact episode is kept to save space. Held under the lock so a newer download can't be
+            # removed instead. A player still reading the original keeps its open handle to the unlinked file.
+            try:
+                os.remove(self._episode_path)
+            except OSError as e:
+                self._log.error("Could not remove original episode {}: {}".format(self._episode_path, e))
+
     def get_latest_episode_path(self):
-        return "episode.mp3"
+        with self._lock:
+            return self._compact_path if self._compact_ready else self._episode_path
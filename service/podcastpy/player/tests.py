@@ -62,3 +62,446 @@ class AlarmTests(unittest.TestCase):
         self.assertEqual(self.service.get_next_alarm(now.time(), now.date())[1], vid)
 
         self.service.remove_alarm(vid)
+
+
+class EpisodeIndexTests(unittest.TestCase):
+    def setUp(self) -> None:
+        import sqlite3
+        from podcastpy.player.episode_index import EpisodeIndex, create_episode_tables
+        self.db = sqlite3.connect(':memory:')
+        create_episode_tables(self.db)
+        self.index = EpisodeIndex(self.db)
+
+    def tearDown(self) -> None:
+        self.db.close()
+
+    @staticmethod
+    def make_entry(guid, title, summary='', duration='10:00'):
+        return {'id': guid,
+                'title': title,
+                'summary': summary,
+                'published_parsed': time.gmtime(0),
+                'itunes_duration': duration}
+
+    def testSearchFindsTitleAndDescription(self):
+        self.index.update_feed('feed', [self.make_entry('1', 'Election night', 'Counting the votes'),
+                                        self.make_entry('2', 'Weather', 'Storm warnings for the election')])
+
+        results, has_more = self.index.search('election')
+
+        self.assertFalse(has_more)
+        # Title matches rank above description matches
+        self.assertEqual([r['guid'] for r in results], ['1', '2'])
+        self.assertEqual(results[0]['duration'], '10:00')
+        self.assertEqual(results[0]['published'], '1970-01-01T00:00:00+00:00')
+
+    def testUpdateIsIncremental(self):
+        entries = [self.make_entry('1', 'First'), self.make_entry('2', 'Second')]
+        self.assertEqual(self.index.update_feed('feed', entries), 2)
+        self.assertEqual(self.index.update_feed('feed', entries), 0)
+
+        entries[0] = self.make_entry('1', 'First renamed')
+        self.assertEqual(self.index.update_feed('feed', entries), 1)
+
+        self.assertEqual([r['title'] for r in self.index.search('renamed')[0]], ['First renamed'])
+        self.assertEqual(self.index.search('second')[0][0]['guid'], '2')
+
+    def testPagination(self):
+        self.index.update_feed('feed', [self.make_entry(str(i), 'News {}'.format(i)) for i in range(5)])
+
+        first, first_more = self.index.search('news', page=0, per_page=2)
+        last, last_more = self.index.search('news', page=2, per_page=2)
+
+        self.assertEqual(len(first), 2)
+        self.assertTrue(first_more)
+        self.assertEqual(len(last), 1)
+        self.assertFalse(last_more)
+
+    def testQuerySyntaxIsEscaped(self):
+        self.index.update_feed('feed', [self.make_entry('1', 'AND "quoted" NEAR(')])
+
+        self.assertEqual(len(self.index.search('"quoted" NEAR(')[0]), 1)
+        self.assertEqual(self.index.search('   ')[0], [])
+
+    def testDescriptionHtmlIsStripped(self):
+        self.index.update_feed('feed', [self.make_entry('1', 'Weather', '<p>Storm &amp; rain</p>')])
+
+        self.assertEqual(self.index.search('p')[0], [])
+        self.assertEqual(self.index.search('storm')[0][0]['description'], 'Storm & rain')
+
+    def testControlCharactersIgnored(self):
+        self.index.update_feed('feed', [self.make_entry('1', 'Weather')])
+
+        self.assertEqual(self.index.search('\x00')[0], [])
+        self.assertEqual(len(self.index.search('weather\x00')[0]), 1)
+
+    def testIndexingFailureDoesNotStopDownload(self):
+        from podcastpy.player.episode_manager import EpisodeManager
+        import sqlite3
+        manager = EpisodeManager(db_path=':memory:')
+        with patch('podcastpy.player.episode_manager.EpisodeIndex.update_feed',
+                   side_effect=sqlite3.OperationalError('database is locked')):
+            manager.index_feed(MagicMock(entries=[]))
+
+    def testInvalidPage(self):
+        with self.assertRaises(ValueError):
+            self.index.search('news', page=-1)
+        with self.assertRaises(ValueError):
+            self.index.search('news', page=10000000000000000000)
+        with self.assertRaises(ValueError):
+            self.index.search('news', per_page=0)
+
+
+class TranscodeTests(unittest.TestCase):
+    def setUp(self) -> None:
+        import concurrent.futures
+        from podcastpy.player.episode_manager import EpisodeManager
+        from podcastpy.player.transcoder import TranscodeResult
+        self.future = concurrent.futures.Future()
+        self.transcoder = MagicMock()
+        self.transcoder.submit.return_value = self.future
+        self.manager = EpisodeManager(transcoder=self.transcoder)
+
+        import tempfile
+        self.dir = tempfile.TemporaryDirectory()
+        self.episode_path = self.dir.name + '/episode.mp3'
+        self.compact_path = self.dir.name + '/episode.compact.mp4'
+        self.manager._episode_path = self.episode_path
+        self.manager._compact_path = self.compact_path
+        with open(self.episode_path, 'wb') as fh:
+            fh.write(b'audio')
+        self.result = TranscodeResult(self.episode_path, self.compact_path, 1000, 250, 1.5)
+
+    def tearDown(self) -> None:
+        self.dir.cleanup()
+
+    def testOriginalUsedUntilVerified(self):
+        self.manager.transcode_episode(self.manager._generation)
+        self.assertEqual(self.manager.get_latest_episode_path(), self.episode_path)
+
+        self.future.set_result(self.result)
+        self.assertEqual(self.manager.get_latest_episode_path(), self.compact_path)
+        self.assertEqual(self.result.compression_ratio, 4)
+
+    def testOriginalRemovedAfterVerifiedTranscode(self):
+        import os
+        self.manager.transcode_episode(self.manager._generation)
+        self.assertTrue(os.path.exists(self.episode_path))
+
+        self.future.set_result(self.result)
+        self.assertFalse(os.path.exists(self.episode_path))
+
+    def testFailedTranscodeKeepsOriginal(self):
+        self.manager.transcode_episode(self.manager._generation)
+        self.future.set_exception(RuntimeError("ffmpeg failed"))
+        self.assertEqual(self.manager.get_latest_episode_path(), self.episode_path)
+
+    def testStaleTranscodeIgnored(self):
+        import os
+        self.manager.transcode_episode(self.manager._generation)
+        self.manager._generation += 1  # A newer episode was downloaded meanwhile
+        self.future.set_result(self.result)
+        self.assertEqual(self.manager.get_latest_episode_path(), self.episode_path)
+        self.assertTrue(os.path.exists(self.episode_path))
+
+    def testSubmitFailureKeepsOriginal(self):
+        from concurrent.futures.process import BrokenProcessPool
+        self.transcoder.submit.side_effect = BrokenProcessPool()
+        self.manager.transcode_episode(self.manager._generation)
+        self.assertEqual(self.manager.get_latest_episode_path(), self.episode_path)
+
+    def testBrokenPoolRecreated(self):
+        from concurrent.futures.process import BrokenProcessPool
+        from podcastpy.player import transcoder
+
+        with patch.object(transcoder.Transcoder, '_create_pool') as create_pool:
+            broken, fresh = MagicMock(), MagicMock()
+            broken.submit.side_effect = BrokenProcessPool()
+            create_pool.side_effect = [broken, fresh]
+
+            t = transcoder.Transcoder()
+            self.assertIs(t.submit('episode.mp3', 'episode.compact.mp4'), fresh.submit.return_value)
+            broken.shutdown.assert_called_once_with(wait=False)
+
+    def testDurationMismatchRejected(self):
+        import os
+        import tempfile
+        from podcastpy.player import transcoder
+
+        with tempfile.TemporaryDirectory() as d:
+            source = os.path.join(d, 'episode.mp3')
+            compact = os.path.join(d, 'episode.compact.mp4')
+            with open(source, 'wb') as fh:
+                fh.write(b'audio')
+
+            def fake_ffmpeg(args, **kwargs):
+                with open(args[-1], 'wb') as out:
+                    out.write(b'a')
+
+            with patch.object(transcoder.subprocess, 'run', side_effect=fake_ffmpeg), \
+                    patch.object(transcoder, '_probe_duration', side_effect=[600.0, 300.0]):
+                with self.assertRaises(RuntimeError):
+                    transcoder.transcode_episode(source, compact)
+
+            self.assertEqual(os.listdir(d), ['episode.mp3'])
+
+
+class FakeTimer(object):
+    """
+    Stands in for threading.Timer so tests decide when (and whether) a scheduled alarm runs.
+    """
+    def __init__(self, timers, interval, function, args):
+        self.interval = interval
+        self.function = function
+        self.args = args
+        self.cancelled = False
+        timers.append(self)
+
+    def start(self):
+        pass
+
+    def cancel(self):
+        self.cancelled = True
+
+    def fire(self):
+        self.function(*self.args)
+
+
+class AlarmJournalTests(unittest.TestCase):
+    def setUp(self) -> None:
+        import tempfile
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = self.dir.name + '/alarms.journal'
+        self.now = datetime.datetime(2026, 10, 19, 7, 0, tzinfo=LocalTimezone())
+        self.alarm_time = datetime.time(7, 30)
+        self.journals = []
+
+    def tearDown(self) -> None:
+        for journal in self.journals:
+            journal.close()
+        self.dir.cleanup()
+
+    def make_scheduler(self, catch_up=None):
+        """
+        Simulates a (re)start of the service. The previous scheduler is abandoned without any cleanup,
+        as if the process had been killed.
+        """
+        from podcastpy.player.alarm_journal import AlarmJournal
+        from podcastpy.player.alarm_scheduler import AlarmScheduler, CatchUpPolicy
+
+        journal = AlarmJournal(self.path, compact_threshold=4)
+        self.journals.append(journal)
+        self.timers = []
+        return AlarmScheduler(journal=journal,
+                              catch_up=catch_up or CatchUpPolicy.FireOnce,
+                              catch_up_window=datetime.timedelta(minutes=30),
+                              clock=lambda: self.now,
+                              timer_factory=lambda *args: FakeTimer(self.timers, *args))
+
+    def start(self, catch_up=None):
+        scheduler = self.make_scheduler(catch_up)
+        self.callback = MagicMock()
+        scheduler.add_alarm(self.alarm_time, self.callback, 'alarm')
+        return scheduler
+
+    def active_timers(self):
+        return [t for t in self.timers if not t.cancelled]
+
+    def testKilledAfterFiringDoesNotReplay(self):
+        self.start()
+        self.now = self.now.replace(minute=30)
+        self.active_timers()[0].fire()
+        self.callback.assert_called_once()
+
+        self.now = self.now.replace(minute=35)
+        self.start()
+
+        self.callback.assert_not_called()
+        # Only the regular timer for tomorrow is armed
+        timer, = self.active_timers()
+        self.assertAlmostEqual(timer.interval, datetime.timedelta(hours=23, minutes=55).total_seconds(), delta=1)
+
+    def testKilledBeforeAlarmCatchesUpOnce(self):
+        self.start()
+
+        self.now = self.now.replace(minute=40)
+        scheduler = self.start()
+        self.callback.assert_not_called()  # Nothing runs until the caller asks for the missed alarms
+        scheduler.run_missed_alarms()
+        self.callback.assert_called_once()
+
+        self.now = self.now.replace(minute=45)
+        self.start().run_missed_alarms()
+        self.callback.assert_not_called()
+
+    def testKilledBeforeCatchUpRanCatchesUpAgain(self):
+        self.start()
+        self.now = self.now.replace(minute=40)
+        self.start()  # The process dies before run_missed_alarms is called
+
+        self.now = self.now.replace(minute=41)
+        self.start().run_missed_alarms()
+        self.callback.assert_called_once()
+
+    def testMissedAlreadyRunIsOnlyRecorded(self):
+        self.start()
+        self.now = self.now.replace(minute=40)
+        scheduler = self.start()
+        scheduler.run_missed_alarms(already_run=[scheduler.get_next_alarm(self.now.time(), self.now.date())[1]])
+        self.callback.assert_not_called()
+
+        self.start().run_missed_alarms()
+        self.callback.assert_not_called()
+
+    def testMissedOutsideWindowIsSkipped(self):
+        self.start()
+        self.now = self.now.replace(hour=9)
+        self.start().run_missed_alarms()
+        self.callback.assert_not_called()
+
+        # The skip is journaled, so a further restart doesn't reconsider it
+        self.now = self.now.replace(minute=1)
+        self.start().run_missed_alarms()
+        self.callback.assert_not_called()
+
+    def testSkipPolicy(self):
+        from podcastpy.player.alarm_scheduler import CatchUpPolicy
+        self.start()
+        self.now = self.now.replace(minute=40)
+        self.start(CatchUpPolicy.Skip).run_missed_alarms()
+        self.callback.assert_not_called()
+
+    def testTornWriteIgnored(self):
+        self.start()
+        with open(self.path, 'a') as fh:
+            fh.write('{"event": "fired", "na')
+
+        self.now = self.now.replace(minute=40)
+        self.start().run_missed_alarms()
+        self.callback.assert_called_once()
+
+    def testStaleTimerDoesNotFireTwice(self):
+        self.start()
+        self.now = self.now.replace(minute=30)
+        timer = self.active_timers()[0]
+        timer.fire()
+        timer.fire()
+        self.callback.assert_called_once()
+
+    def testControllerCatchesUpAfterPreload(self):
+        from podcastpy.player.alarm_controller import AlarmController
+        from podcastpy.player.player import PlayerState
+
+        def start_controller():
+            scheduler = self.make_scheduler()
+            parent = Mock()
+            parent.player.get_state.return_value = PlayerState.NotPlaying
+            db = MagicMock()
+            db.get_alarm.return_value = (self.alarm_time, True)
+            AlarmController(scheduler, parent.manager, parent.player, db)
+            return parent
+
+        start_controller()
+        # Both the preload and the alarm come due while the service is down
+        self.now = self.now.replace(minute=35)
+        parent = start_controller()
+
+        calls = [c[0] for c in parent.mock_calls if c[0] in ('manager.preload_episode', 'player.play')]
+        self.assertEqual(calls, ['manager.preload_episode', 'player.play'])
+        self.assertEqual([t for t in self.timers if t.interval == 0], [])
+
+        self.now = self.now.replace(minute=36)
+        parent = start_controller()
+        parent.player.play.assert_not_called()
+
+    def testFailingWriteKeepsAlarmRunning(self):
+        import errno
+        self.start()
+        self.now = self.now.replace(minute=30)
+
+        with patch('podcastpy.player.alarm_journal.os.fsync', side_effect=OSError(errno.ENOSPC, 'No space left')):
+            self.active_timers()[0].fire()
+
+        self.callback.assert_called_once()
+        timer, = self.active_timers()
+        self.assertAlmostEqual(timer.interval, datetime.timedelta(days=1).total_seconds(), delta=1)
+
+        # The next successful write restores the records that were lost
+        self.journals[-1].record_pending('other', self.now)
+        self.now = self.now.replace(minute=35)
+        self.start().run_missed_alarms()
+        self.callback.assert_not_called()
+        self.assertEqual(self.journals[-1].get_last_fired('alarm'), self.now.date())
+
+    def testCorruptRecordsSkipped(self):
+        from podcastpy.player.alarm_journal import AlarmJournal
+        with open(self.path, 'w') as fh:
+            fh.write('{"event": "pending", "name": "alarm"}\n')
+            fh.write('123\n')
+            fh.write('{"event": "fired", "name": "alarm", "date": "2026-10-1"}\n')
+            fh.write('{"event": "fired", "name": "preload", "date": "2026-10-18"}\n')
+
+        journal = AlarmJournal(self.path)
+        self.journals.append(journal)
+        self.assertIsNone(journal.get_pending('alarm'))
+        self.assertIsNone(journal.get_last_fired('alarm'))
+        self.assertEqual(journal.get_last_fired('preload'), datetime.date(2026, 10, 18))
+
+    def testFailedCompactionKeepsJournalWritable(self):
+        from podcastpy.player.alarm_journal import AlarmJournal
+        journal = AlarmJournal(self.path, compact_threshold=2)
+        self.journals.append(journal)
+
+        with patch('podcastpy.player.alarm_journal.os.replace', side_effect=OSError('read-only')):
+            for day in range(1, 4):
+                journal.record_fired('alarm', datetime.date(2026, 10, day))
+        journal.record_fired('preload', datetime.date(2026, 10, 4))
+        journal.close()
+
+        reloaded = AlarmJournal(self.path)
+        self.journals.append(reloaded)
+        self.assertEqual(reloaded.get_last_fired('alarm'), datetime.date(2026, 10, 3))
+        self.assertEqual(reloaded.get_last_fired('preload'), datetime.date(2026, 10, 4))
+
+    def testConcurrentWritesDuringCompaction(self):
+        import threading
+        from podcastpy.player.alarm_journal import AlarmJournal
+
+        journal = AlarmJournal(self.path, compact_threshold=2)
+        self.journals.append(journal)
+        errors = []
+
+        def write(name):
+            try:
+                for day in range(1, 29):
+                    journal.record_fired(name, datetime.date(2026, 2, day))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=write, args=('alarm{}'.format(i),)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        journal.close()
+        reloaded = AlarmJournal(self.path)
+        self.journals.append(reloaded)
+        for i in range(4):
+            self.assertEqual(reloaded.get_last_fired('alarm{}'.format(i)), datetime.date(2026, 2, 28))
+
+    def testJournalIsCompacted(self):
+        scheduler = self.start()
+        for _ in range(9):
+            self.now = self.now + datetime.timedelta(days=1)
+            self.active_timers()[-1].fire()
+
+        with open(self.path) as fh:
+            self.assertLessEqual(len(fh.readlines()), 4)
+
+        vid = scheduler.get_next_alarm(self.now.time(), self.now.date())[1]
+        self.assertTrue(scheduler.remove_alarm(vid))
+        self.callback.reset_mock()
+        self.start().run_missed_alarms()
+        self.callback.assert_not_called()
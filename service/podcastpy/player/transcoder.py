@@ -0,0 +1,111 @@
+import concurrent.futures
+import concurrent.futures.process
+import logging
+import multiprocessing
+import os
+import resource
+import subprocess
+
+log = logging.getLogger(__name__)
+
+# Speech only needs a narrow band; mono Opus at this bitrate is transparent enough for news podcasts
+BITRATE = '24k'
+
+# Allowed difference in seconds between the original and the transcoded episode's duration
+DURATION_TOLERANCE = 1.0
+
+
+class TranscodeResult(object):
+    def __init__(self, source_path, compact_path, source_size, compact_size, cpu_seconds):
+        self.source_path = source_path
+        self.compact_path = compact_path
+        self.source_size = source_size
+        self.compact_size = compact_size
+        self.cpu_seconds = cpu_seconds
+
+    @property
+    def compression_ratio(self):
+        return self.source_size / self.compact_size
+
+
+def _lower_priority():
+    os.nice(19)
+
+
+def _probe_duration(path) -> float:
+    out = subprocess.run(['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', path],
+                         stdout=subprocess.PIPE, check=True)
+    return float(out.stdout.decode().strip())
+
+
+def _children_cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def transcode_episode(source_path, compact_path) -> TranscodeResult:
+    """
+    Transcodes an episode to mono Opus in an MP4 container with the seek index at the start of the file.
+    Only moves the result to compact_path once its duration matches the original.
+    :param source_path: The downloaded episode
+    :param compact_path: Where the verified compact episode is stored
+    :return: TranscodeResult
+    :raises RuntimeError: If the compact episode could not be verified
+    """
+    tmp_path = compact_path + '.tmp'
+    cpu_before = _children_cpu_seconds()
+    try:
+        subprocess.run(['ffmpeg', '-v', 'error', '-y', '-i', source_path,
+                        '-vn', '-ac', '1', '-c:a', 'libopus', '-b:a', BITRATE, '-application', 'voip',
+                        '-movflags', '+faststart', '-f', 'mp4', tmp_path],
+                       check=True)
+
+        source_duration = _probe_duration(source_path)
+        compact_duration = _probe_duration(tmp_path)
+        if abs(source_duration - compact_duration) > DURATION_TOLERANCE:
+            raise RuntimeError("Transcoded duration {}s does not match original {}s".format(
+                compact_duration, source_duration))
+
+        result = TranscodeResult(source_path, compact_path, os.path.getsize(source_path),
+                                 os.path.getsize(tmp_path), _children_cpu_seconds() - cpu_before)
+        os.replace(tmp_path, compact_path)
+        return result
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError("Transcoding {} failed: {}".format(source_path, e))
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class Transcoder(object):
+    """
+    Transcodes episodes in a low priority background process so it never competes with playback.
+    Every job writes the same compact file, so the pool has a single worker: jobs run in submission order and
+    an older episode can never be moved into place after a newer one.
+    """
+    def __init__(self):
+        self._log = logging.getLogger(__name__)
+        self._pool = self._create_pool()
+
+    @staticmethod
+    def _create_pool():
+        # Spawn rather than fork, the parent has VLC and timer threads running
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_lower_priority)
+
+    def submit(self, source_path, compact_path) -> concurrent.futures.Future:
+        """
+        Queues an episode for transcoding
+        :return: A future resolving to a TranscodeResult
+        """
+        self._log.info("Queueing transcode of {}".format(source_path))
+        try:
+            return self._pool.submit(transcode_episode, source_path, compact_path)
+        except concurrent.futures.process.BrokenProcessPool:
+            # A dead worker breaks the pool for good, start a fresh one
+            self._log.error("Transcoder pool broken, recreating it")
+            self._pool.shutdown(wait=False)
+            self._pool = self._create_pool()
+            return self._pool.submit(transcode_episode, source_path, compact_path)
@@ -9,3 +9,4 @@ def includeme(config):
     config.add_route('state', '/state')
     config.add_route('image', '/image')
     config.add_route('alarm', '/alarm')
+    config.add_route('search', '/search')
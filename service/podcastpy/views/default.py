@@ -15,7 +15,7 @@ alarm_controller = None
 @subscriber(DbCreated)
 def initialize(event):
     global alarm_controller
-    alarm_controller = get_default_alarm_controller(event.db)
+    alarm_controller = get_default_alarm_controller(event.db, event.settings)
 
 
 @view_config(route_name='state', request_method='GET', renderer='json')
@@ -76,6 +76,18 @@ def get_image_url_handler(request):
     return Response(alarm_controller.get_image_url())
 
 
+@view_config(route_name='search', request_method='GET', renderer='json')
+def search_episodes_handler(request):
+    try:
+        page = int(request.GET.get('page', 0))
+        per_page = int(request.GET.get('per_page', 20))
+        results, has_more = request.episode_index.search(request.GET.get('q', ''), page, per_page)
+    except ValueError as e:
+        request.response.status = 400
+        return {'error': str(e)}
+    return {'results': results, 'page': page, 'has_more': has_more}
+
+
 @view_config(route_name='alarm', request_method='GET', renderer='json')
 def get_next_alarm_time(request):
     next_time, enabled = alarm_controller.get_next_alarm_time()